@@ -1,8 +1,12 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Query, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.errors import DuplicateKeyError
+from pymongo.read_preferences import SecondaryPreferred
 import os
 import logging
 from pathlib import Path
@@ -13,21 +17,122 @@ from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
 import base64
+import hashlib
+import json
+import zlib
+import sys
+import time
+import random
+import threading
+import contextvars
+from collections import Counter, OrderedDict
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Per-request stats. Motor copies the context into its executor threads, so the
+# listener sees the stats of the request that issued the command.
+request_stats: contextvars.ContextVar[Optional["RequestStats"]] = contextvars.ContextVar('request_stats', default=None)
+
+class RequestStats:
+    """DB wall time for one request.
+
+    Commands can overlap in Motor's thread pool, so db_ms counts the wall time during
+    which at least one command was in flight rather than summing command durations.
+    """
+
+    def __init__(self):
+        self.db_ms = 0.0
+        self.queries = 0
+        self._in_flight = 0
+        self._busy_since = 0.0
+        self._lock = threading.Lock()
+
+    def command_started(self):
+        with self._lock:
+            if self._in_flight == 0:
+                self._busy_since = time.perf_counter()
+            self._in_flight += 1
+
+    def command_finished(self):
+        with self._lock:
+            self._in_flight -= 1
+            self.queries += 1
+            if self._in_flight == 0:
+                self.db_ms += (time.perf_counter() - self._busy_since) * 1000
+
+class DbTimingListener(monitoring.CommandListener):
+    def started(self, event):
+        stats = request_stats.get()
+        if stats is not None:
+            stats.command_started()
+
+    def succeeded(self, event):
+        self._finished()
+
+    def failed(self, event):
+        self._finished()
+
+    def _finished(self):
+        stats = request_stats.get()
+        if stats is not None:
+            stats.command_finished()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+mongo_options = {
+    "maxPoolSize": int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    "minPoolSize": int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+    "maxIdleTimeMS": int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '0')) or None,
+    "connectTimeoutMS": int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '20000')),
+    "socketTimeoutMS": int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '0')) or None,
+    "serverSelectionTimeoutMS": int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '30000')),
+    "waitQueueTimeoutMS": int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0')) or None,
+    "event_listeners": [DbTimingListener()],
+}
+# Comma-separated, e.g. "zstd,snappy,zlib"; zstd/snappy need their optional packages installed
+mongo_compressors = os.environ.get('MONGO_COMPRESSORS', '')
+if mongo_compressors:
+    mongo_options["compressors"] = mongo_compressors
+client = AsyncIOMotorClient(mongo_url, **mongo_options)
+
+# Writes and auth always go to the primary. Read-heavy endpoints use read_db,
+# which prefers secondaries and falls back to the primary on a standalone server.
+# MongoDB requires maxStalenessSeconds to be at least 90; -1 disables the bound.
+# pymongo only rejects a bad value when a replica-set read runs, so fail fast here.
+READ_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_READ_MAX_STALENESS_SECONDS', '90'))
+if READ_MAX_STALENESS_SECONDS != -1 and READ_MAX_STALENESS_SECONDS < 90:
+    raise ValueError(
+        f"MONGO_READ_MAX_STALENESS_SECONDS must be -1 or at least 90, got {READ_MAX_STALENESS_SECONDS}"
+    )
 db = client[os.environ['DB_NAME']]
+read_db = client.get_database(
+    os.environ['DB_NAME'],
+    read_preference=SecondaryPreferred(max_staleness=READ_MAX_STALENESS_SECONDS)
+)
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'tfd-secret-key-2025-turkish-armed-forces')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Export Configuration
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', str(64 * 1024)))
+EXPORT_COLLECTIONS = {"chat_messages", "announcements"}
+
+# Profiling Configuration
+PROFILE_HEADER = "X-Profile"
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_INTERVAL_MS', '5')) / 1000
+PROFILE_MAX_STORED = int(os.environ.get('PROFILE_MAX_STORED', '50'))
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '1000'))
+
+# Idempotency Configuration
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('IDEMPOTENCY_MAX_KEYS', '10000'))
+
 security = HTTPBearer()
 
 # Create the main app without a prefix
@@ -117,17 +222,20 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_access_token(token: str) -> dict:
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return payload
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    user_id = decode_access_token(credentials.credentials)["sub"]
     
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if user is None:
@@ -139,6 +247,102 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     return User(**user)
 
+async def get_current_admin(current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["admin", "founder"]:
+        raise HTTPException(status_code=403, detail="Only admins and founders can access this resource")
+    return current_user
+
+async def stream_ndjson(cursor, compress: bool = False):
+    """Yield documents from a cursor as NDJSON, optionally gzip-compressed.
+
+    Lines are buffered into chunks of about EXPORT_CHUNK_BYTES so the response makes
+    one write per chunk rather than per document. The cursor is closed when the
+    client disconnects.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+    try:
+        async for doc in cursor:
+            line = (json.dumps(doc, default=str, ensure_ascii=False) + "\n").encode('utf-8')
+            buffer += compressor.compress(line) if compressor is not None else line
+            if len(buffer) >= EXPORT_CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+        if compressor is not None:
+            buffer += compressor.flush()
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        await cursor.close()
+
+
+# Recently completed posts, keyed by "<collection>:<user id>:<Idempotency-Key>"
+idempotency_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+# Bookkeeping fields stored on keyed posts; kept out of API responses and exports
+IDEMPOTENCY_FIELDS = ["idempotency_key", "idempotency_fingerprint", "idempotency_expires_at"]
+
+def request_fingerprint(data: BaseModel) -> str:
+    return hashlib.sha256(data.model_dump_json().encode('utf-8')).hexdigest()
+
+def idempotency_cache_get(cache_key: str, fingerprint: str):
+    entry = idempotency_cache.get(cache_key)
+    if entry is None:
+        return None
+    expires_at, stored_fingerprint, result = entry
+    if expires_at < time.monotonic():
+        del idempotency_cache[cache_key]
+        return None
+    check_fingerprint(stored_fingerprint, fingerprint)
+    return result
+
+def idempotency_cache_set(cache_key: str, fingerprint: str, result):
+    idempotency_cache[cache_key] = (time.monotonic() + IDEMPOTENCY_TTL_SECONDS, fingerprint, result)
+    idempotency_cache.move_to_end(cache_key)
+    while len(idempotency_cache) > IDEMPOTENCY_MAX_KEYS:
+        idempotency_cache.popitem(last=False)
+
+def check_fingerprint(stored_fingerprint: str, fingerprint: str):
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+
+async def insert_idempotent(collection: str, scoped_key: Optional[str], fingerprint: str, doc: dict, result, model):
+    """Insert doc, or return the document an earlier request with the same key created.
+
+    The unique index on idempotency_key catches retries. A key older than
+    IDEMPOTENCY_TTL_SECONDS is released from its old document so it can be reused.
+    """
+    if scoped_key is None:
+        await db[collection].insert_one(doc)
+        return result
+    
+    cache_key = f"{collection}:{scoped_key}"
+    doc['idempotency_key'] = scoped_key
+    doc['idempotency_fingerprint'] = fingerprint
+    for _ in range(2):
+        now = datetime.now(timezone.utc)
+        doc['idempotency_expires_at'] = now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        doc.pop('_id', None)
+        try:
+            await db[collection].insert_one(doc)
+        except DuplicateKeyError:
+            released = await db[collection].update_one(
+                {"idempotency_key": scoped_key, "idempotency_expires_at": {"$lte": now}},
+                {"$unset": {field: "" for field in IDEMPOTENCY_FIELDS}}
+            )
+            if released.modified_count:
+                continue
+            existing = await db[collection].find_one({"idempotency_key": scoped_key}, {"_id": 0})
+            if existing is None:
+                continue
+            check_fingerprint(existing['idempotency_fingerprint'], fingerprint)
+            if isinstance(existing['timestamp'], str):
+                existing['timestamp'] = datetime.fromisoformat(existing['timestamp'])
+            result = model(**existing)
+        idempotency_cache_set(cache_key, fingerprint, result)
+        return result
+    raise HTTPException(status_code=409, detail="Idempotency-Key is in use by a concurrent request")
+
 
 # ============ AUTH ROUTES ============
 
@@ -170,7 +374,7 @@ async def register(user_data: UserRegister):
     await db.users.insert_one(user_dict)
     
     # Create token
-    access_token = create_access_token(data={"sub": user.id})
+    access_token = create_access_token(data={"sub": user.id, "role": user.role})
     
     return Token(access_token=access_token, token_type="bearer", user=user)
 
@@ -195,7 +399,7 @@ async def login(login_data: UserLogin):
     user = User(**{k: v for k, v in user_doc.items() if k != 'password'})
     
     # Create token
-    access_token = create_access_token(data={"sub": user.id})
+    access_token = create_access_token(data={"sub": user.id, "role": user.role})
     
     return Token(access_token=access_token, token_type="bearer", user=user)
 
@@ -246,7 +450,7 @@ async def admin_login(login_data: AdminLogin):
         user = User(**{k: v for k, v in user_doc.items() if k != 'password'})
     
     # Create token
-    access_token = create_access_token(data={"sub": user.id})
+    access_token = create_access_token(data={"sub": user.id, "role": user.role})
     
     return Token(access_token=access_token, token_type="bearer", user=user)
 
@@ -265,7 +469,7 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 
 @api_router.get("/users/online-count")
 async def get_online_count():
-    count = await db.users.count_documents({"online_status": True})
+    count = await read_db.users.count_documents({"online_status": True})
     return {"online_count": count}
 
 @api_router.put("/users/profile-picture", response_model=User)
@@ -288,7 +492,7 @@ async def update_profile_picture(data: ProfilePictureUpdate, current_user: User
 
 @api_router.get("/chat/messages", response_model=List[ChatMessage])
 async def get_messages(current_user: User = Depends(get_current_user)):
-    messages = await db.chat_messages.find({}, {"_id": 0}).sort("timestamp", 1).to_list(500)
+    messages = await read_db.chat_messages.find({}, {"_id": 0}).sort("timestamp", 1).to_list(500)
     
     # Convert timestamps
     for msg in messages:
@@ -298,7 +502,19 @@ async def get_messages(current_user: User = Depends(get_current_user)):
     return messages
 
 @api_router.post("/chat/messages", response_model=ChatMessage)
-async def send_message(message_data: ChatMessageCreate, current_user: User = Depends(get_current_user)):
+async def send_message(
+    message_data: ChatMessageCreate,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    # A retried request returns the original message instead of inserting a duplicate
+    scoped_key = f"{current_user.id}:{idempotency_key}" if idempotency_key else None
+    fingerprint = request_fingerprint(message_data)
+    if scoped_key:
+        existing = idempotency_cache_get(f"chat_messages:{scoped_key}", fingerprint)
+        if existing is not None:
+            return existing
+    
     message = ChatMessage(
         user_id=current_user.id,
         username=current_user.username,
@@ -310,16 +526,14 @@ async def send_message(message_data: ChatMessageCreate, current_user: User = Dep
     msg_dict = message.model_dump()
     msg_dict['timestamp'] = msg_dict['timestamp'].isoformat()
     
-    await db.chat_messages.insert_one(msg_dict)
-    
-    return message
+    return await insert_idempotent("chat_messages", scoped_key, fingerprint, msg_dict, message, ChatMessage)
 
 
 # ============ ANNOUNCEMENT ROUTES ============
 
 @api_router.get("/announcements", response_model=List[Announcement])
 async def get_announcements(current_user: User = Depends(get_current_user)):
-    announcements = await db.announcements.find({}, {"_id": 0}).sort("timestamp", -1).to_list(100)
+    announcements = await read_db.announcements.find({}, {"_id": 0}).sort("timestamp", -1).to_list(100)
     
     # Convert timestamps
     for ann in announcements:
@@ -329,11 +543,22 @@ async def get_announcements(current_user: User = Depends(get_current_user)):
     return announcements
 
 @api_router.post("/announcements", response_model=Announcement)
-async def create_announcement(announcement_data: AnnouncementCreate, current_user: User = Depends(get_current_user)):
+async def create_announcement(
+    announcement_data: AnnouncementCreate,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     # Check if user is admin or founder
     if current_user.role not in ["admin", "founder"]:
         raise HTTPException(status_code=403, detail="Only admins and founders can create announcements")
     
+    scoped_key = f"{current_user.id}:{idempotency_key}" if idempotency_key else None
+    fingerprint = request_fingerprint(announcement_data)
+    if scoped_key:
+        existing = idempotency_cache_get(f"announcements:{scoped_key}", fingerprint)
+        if existing is not None:
+            return existing
+    
     announcement = Announcement(
         admin_id=current_user.id,
         admin_name=current_user.username,
@@ -346,9 +571,188 @@ async def create_announcement(announcement_data: AnnouncementCreate, current_use
     ann_dict = announcement.model_dump()
     ann_dict['timestamp'] = ann_dict['timestamp'].isoformat()
     
-    await db.announcements.insert_one(ann_dict)
-    
-    return announcement
+    return await insert_idempotent("announcements", scoped_key, fingerprint, ann_dict, announcement, Announcement)
+
+
+# ============ PROFILING ============
+
+# Most recent profiles as collapsed stacks, keyed by profile id
+stored_profiles: "OrderedDict[str, str]" = OrderedDict()
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread and counts collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        # Sample once before the first wait so even short requests get a stack
+        while True:
+            self._sample()
+            if self._stop.wait(self.interval):
+                break
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        self.samples += 1
+        # An event loop blocked in the selector (or a C loop such as uvloop, which
+        # has no Python frame) is waiting on I/O rather than running on the CPU
+        if frame is None:
+            self.idle_samples += 1
+            return
+        if frame.f_code.co_name == "select" and frame.f_globals.get('__name__') == "selectors":
+            self.idle_samples += 1
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        self.stacks[";".join(reversed(names))] += 1
+
+    def on_cpu_share(self) -> float:
+        return 1 - self.idle_samples / self.samples if self.samples else 0.0
+
+    def collapsed(self) -> str:
+        # Brendan Gregg's collapsed-stack format, ready for flamegraph.pl / speedscope
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def store_profile(profile_id: str, profile: str):
+    stored_profiles[profile_id] = profile
+    while len(stored_profiles) > PROFILE_MAX_STORED:
+        stored_profiles.popitem(last=False)
+
+def is_admin_token(headers: dict) -> bool:
+    """Check the role claim of the bearer token, without a DB lookup."""
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth.startswith("Bearer "):
+        return False
+    try:
+        payload = decode_access_token(auth[len("Bearer "):])
+    except HTTPException:
+        return False
+    return payload.get("role") in ["admin", "founder"]
+
+class ProfilingMiddleware:
+    """Samples opted-in requests and logs slow ones, timing until the last body chunk is sent.
+
+    Admins opt in with "X-Profile: 1"; PROFILE_SAMPLE_RATE also samples a fraction of traffic.
+    The caller's role comes from the token's role claim, so profiling adds no DB query and
+    other users' opt-ins are ignored before any sampling starts. Only one request is sampled
+    at a time, since the event loop thread is shared and concurrent requests would show up
+    in each other's stacks anyway.
+    """
+
+    sampling = False
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        stats = RequestStats()
+        request_stats.set(stats)
+        headers = dict(scope["headers"])
+        
+        requested = headers.get(PROFILE_HEADER.lower().encode()) == b"1"
+        sampled = bool(PROFILE_SAMPLE_RATE) and random.random() < PROFILE_SAMPLE_RATE
+        admin = (requested or sampled) and is_admin_token(headers)
+        sampler = None
+        if ((requested and admin) or sampled) and not ProfilingMiddleware.sampling:
+            ProfilingMiddleware.sampling = True
+            sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_SECONDS)
+            sampler.start()
+        profile_id = str(uuid.uuid4())
+        
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start" and sampler is not None and admin:
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+        
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            total_ms = (time.perf_counter() - start) * 1000
+            # CPU used by the event loop thread while this request ran. Other requests on
+            # the loop count too, so this is an upper bound; Motor's own work runs in its
+            # thread pool and is part of db_wall instead.
+            loop_cpu_ms = (time.thread_time() - cpu_start) * 1000
+            if sampler is not None:
+                sampler.stop()
+                ProfilingMiddleware.sampling = False
+                store_profile(profile_id, sampler.collapsed())
+            
+            if total_ms >= SLOW_REQUEST_MS:
+                on_cpu = f" on_cpu={sampler.on_cpu_share():.0%}" if sampler is not None else ""
+                logger.warning(
+                    "Slow request %s %s: total=%.1fms db_wall=%.1fms (%d queries) loop_cpu<=%.1fms%s",
+                    scope["method"], scope["path"], total_ms, stats.db_ms, stats.queries,
+                    loop_cpu_ms, on_cpu
+                )
+
+
+# ============ ADMIN ROUTES ============
+
+@api_router.get("/admin/export/{collection}")
+async def export_collection(
+    collection: str,
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    gzip: bool = Query(False),
+    current_user: User = Depends(get_current_admin)
+):
+    if collection not in EXPORT_COLLECTIONS:
+        raise HTTPException(status_code=404, detail="Unknown export collection")
+    
+    # Timestamps are stored as ISO strings in UTC, so range filters compare lexically
+    time_filter = {}
+    if since is not None:
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        time_filter['$gte'] = since.astimezone(timezone.utc).isoformat()
+    if until is not None:
+        if until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc)
+        time_filter['$lt'] = until.astimezone(timezone.utc).isoformat()
+    query = {"timestamp": time_filter} if time_filter else {}
+    
+    projection = {"_id": 0, **{field: 0 for field in IDEMPOTENCY_FIELDS}}
+    cursor = read_db[collection].find(query, projection).sort("timestamp", 1).batch_size(EXPORT_BATCH_SIZE)
+    
+    filename = f"{collection}.ndjson" + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    media_type = "application/gzip" if gzip else "application/x-ndjson"
+    
+    return StreamingResponse(stream_ndjson(cursor, compress=gzip), media_type=media_type, headers=headers)
+
+
+@api_router.get("/admin/profiles")
+async def list_profiles(current_user: User = Depends(get_current_admin)):
+    return {"profile_ids": list(reversed(stored_profiles))}
+
+@api_router.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, current_user: User = Depends(get_current_admin)):
+    if profile_id not in stored_profiles:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return stored_profiles[profile_id]
 
 
 # Include the router in the main app
@@ -369,6 +773,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+app.add_middleware(ProfilingMiddleware)
+
+@app.on_event("startup")
+async def create_indexes():
+    for collection in ["chat_messages", "announcements"]:
+        # Lets the export and list endpoints walk timestamp order (and since/until ranges)
+        # from the index instead of sorting the whole collection in memory
+        await db[collection].create_index("timestamp")
+        # Backs Idempotency-Key: only posts that sent a key carry the field
+        await db[collection].create_index(
+            "idempotency_key",
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$exists": True}}
+        )
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -2,6 +2,11 @@ import requests
 import sys
 from datetime import datetime
 import json
+import gzip
+
+def parse_timestamp(value):
+    """Parse an API timestamp, accepting a trailing Z for UTC"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
 
 class TFDAPITester:
     def __init__(self, base_url="https://tfd-roblox.preview.emergentagent.com"):
@@ -29,10 +34,12 @@ class TFDAPITester:
             "details": details
         })
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, token=None):
+    def run_test(self, name, method, endpoint, expected_status, data=None, token=None, extra_headers=None):
         """Run a single API test"""
         url = f"{self.api_url}/{endpoint}"
         headers = {'Content-Type': 'application/json'}
+        if extra_headers:
+            headers.update(extra_headers)
         
         if token:
             headers['Authorization'] = f'Bearer {token}'
@@ -185,6 +192,52 @@ class TFDAPITester:
         )
         return success, response
 
+    def test_idempotent_post(self, label, endpoint, collection, data, changed_data, match_field, token=None):
+        """Test that retrying a post with the same Idempotency-Key returns the original and stores it once"""
+        key = f"retry-{datetime.now().strftime('%H%M%S%f')}"
+        
+        _, first = self.run_test(
+            f"Post {label} with Idempotency-Key",
+            "POST",
+            endpoint,
+            200,
+            data=data,
+            token=token,
+            extra_headers={'Idempotency-Key': key}
+        )
+        _, retry = self.run_test(
+            f"Retry {label} with Idempotency-Key",
+            "POST",
+            endpoint,
+            200,
+            data=data,
+            token=token,
+            extra_headers={'Idempotency-Key': key}
+        )
+        same = bool(first) and first.get('id') == retry.get('id')
+        self.log_test(f"Idempotent Retry Returns Original {label}", same,
+                      "" if same else f"Got ids {first.get('id')} and {retry.get('id')}")
+        
+        self.run_test(
+            f"Reuse {label} Idempotency-Key with Different Body (Should Fail)",
+            "POST",
+            endpoint,
+            422,
+            data=changed_data,
+            token=token,
+            extra_headers={'Idempotency-Key': key}
+        )
+        
+        # Count through the export so long histories don't hide the new document
+        stored_once = False
+        if same and self.admin_token:
+            docs = self.fetch_export(collection, {'since': first['timestamp']}) or []
+            stored = sum(1 for doc in docs if doc.get(match_field) == data[match_field])
+            stored_once = stored == 1
+            self.log_test(f"Idempotent {label} Stored Once", stored_once,
+                          "" if stored_once else f"Found {stored} documents")
+        return same and stored_once
+
     def test_get_messages(self):
         """Test getting chat messages"""
         success, response = self.run_test(
@@ -248,6 +301,117 @@ class TFDAPITester:
         )
         return success, response
 
+    def test_export(self, collection, token_type="admin", expected_status=200):
+        """Test streaming NDJSON export (admin/founder only)"""
+        token = self.token
+        if token_type == "admin":
+            token = self.admin_token
+        elif token_type == "founder":
+            token = self.founder_token
+            
+        success, response = self.run_test(
+            f"Export {collection} ({token_type})",
+            "GET",
+            f"admin/export/{collection}",
+            expected_status,
+            token=token
+        )
+        return success, response
+
+    def fetch_export(self, collection, params=None):
+        """Download an export as admin and parse it; returns a list of documents or None"""
+        url = f"{self.api_url}/admin/export/{collection}"
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        try:
+            response = requests.get(url, params=params, headers=headers, timeout=30)
+            if response.status_code != 200:
+                return None
+            body = response.content
+            if params and params.get('gzip') == 'true':
+                body = gzip.decompress(body)
+            return [json.loads(line) for line in body.decode('utf-8').splitlines() if line]
+        except (requests.exceptions.RequestException, OSError, ValueError) as e:
+            print(f"   Export error: {str(e)}")
+            return None
+
+    def test_export_ndjson(self, collection):
+        """Test that every exported line is a JSON document and gzip output matches"""
+        docs = self.fetch_export(collection)
+        valid = docs is not None and all(isinstance(doc, dict) and 'id' in doc for doc in docs)
+        self.log_test(f"Export {collection} NDJSON Lines", valid,
+                      "" if valid else "Body is not NDJSON documents")
+        
+        gz_docs = self.fetch_export(collection, {'gzip': 'true'})
+        # Other clients may post in between, so the plain export must be a subset of the gzip one
+        same = (valid and gz_docs is not None
+                and {doc['id'] for doc in docs} <= {doc['id'] for doc in gz_docs})
+        self.log_test(f"Export {collection} Gzip", same,
+                      "" if same else "Gzip export missing or differs from plain export")
+        if valid:
+            print(f"   Exported {len(docs)} documents")
+        return valid and same
+
+    def test_export_time_range(self, message):
+        """Test that since/until split the export around a known message"""
+        timestamp = message.get('timestamp')
+        since_docs = self.fetch_export("chat_messages", {'since': timestamp})
+        until_docs = self.fetch_export("chat_messages", {'until': timestamp})
+        
+        cutoff = parse_timestamp(timestamp)
+        success = (
+            since_docs is not None and until_docs is not None
+            and message['id'] in {doc['id'] for doc in since_docs}
+            and message['id'] not in {doc['id'] for doc in until_docs}
+            and all(parse_timestamp(doc['timestamp']) >= cutoff for doc in since_docs)
+            and all(parse_timestamp(doc['timestamp']) < cutoff for doc in until_docs)
+        )
+        self.log_test("Export Time Range Filter", success,
+                      "" if success else "since/until did not split the export at the message timestamp")
+        return success
+
+    def test_profiling(self):
+        """Test that X-Profile returns a fetchable profile to admins and nothing to regular users"""
+        url = f"{self.api_url}/users/me"
+        try:
+            # The gzip export does enough work to be sampled even on a small database
+            admin_response = requests.get(f"{self.api_url}/admin/export/chat_messages", params={'gzip': 'true'}, headers={
+                'Authorization': f'Bearer {self.admin_token}', 'X-Profile': '1'
+            }, timeout=30)
+            profile_id = admin_response.headers.get('X-Profile-Id')
+            profile = ""
+            if profile_id is not None:
+                profile_response = requests.get(
+                    f"{self.api_url}/admin/profiles/{profile_id}",
+                    headers={'Authorization': f'Bearer {self.admin_token}'},
+                    timeout=10
+                )
+                if profile_response.status_code == 200:
+                    profile = profile_response.text
+            # Collapsed stacks: one "frame;frame;... count" line per distinct stack
+            lines = profile.splitlines()
+            fetched = bool(lines) and all(
+                line.rpartition(' ')[2].isdigit() and line.rpartition(' ')[0] for line in lines
+            )
+            self.log_test("Admin Profile Requested and Fetched", fetched,
+                          "" if fetched else f"X-Profile-Id={profile_id}, profile={profile[:80]!r}")
+            
+            user_response = requests.get(url, headers={
+                'Authorization': f'Bearer {self.token}', 'X-Profile': '1'
+            }, timeout=10)
+            user_profile_id = user_response.headers.get('X-Profile-Id')
+            list_status = requests.get(
+                f"{self.api_url}/admin/profiles",
+                headers={'Authorization': f'Bearer {self.token}'},
+                timeout=10
+            ).status_code
+            denied = user_profile_id is None and list_status == 403
+            self.log_test("Regular User Gets No Profile", denied,
+                          "" if denied else f"X-Profile-Id={user_profile_id}, profiles status {list_status}")
+            return fetched and denied
+        except requests.exceptions.RequestException as e:
+            self.log_test("Profiling", False, f"Request error: {str(e)}")
+            return False
+
     def test_logout(self, token_type="regular"):
         """Test logout"""
         token = self.token
@@ -304,11 +468,21 @@ def main():
     # Test 6: Chat System
     print("\n💬 Testing Chat System...")
     tester.test_send_message("Test message from regular user", "regular")
+    admin_message = {}
     if admin_success:
-        tester.test_send_message("Test message from admin", "admin")
+        _, admin_message = tester.test_send_message("Test message from admin", "admin")
     if founder_success:
         tester.test_send_message("Test message from founder", "founder")
     
+    unique = datetime.now().strftime('%H%M%S%f')
+    tester.test_idempotent_post(
+        "Message",
+        "chat/messages",
+        "chat_messages",
+        {"message": f"Idempotent test message {unique}"},
+        {"message": f"Different message {unique}"},
+        "message"
+    )
     tester.test_get_messages()
 
     # Test 7: Announcements
@@ -335,10 +509,37 @@ def main():
             "founder"
         )
     
+    if admin_success:
+        tester.test_idempotent_post(
+            "Announcement",
+            "announcements",
+            "announcements",
+            {"title": f"Idempotent Announcement {unique}", "content": "Sent twice, stored once"},
+            {"title": f"Different Announcement {unique}", "content": "Should be rejected"},
+            "title",
+            token=tester.admin_token
+        )
+    
     # Get announcements again to verify creation
     tester.test_get_announcements()
 
-    # Test 8: Logout
+    # Test 8: Export
+    print("\n📦 Testing Export...")
+    tester.test_export("chat_messages", "regular", 403)
+    if admin_success:
+        tester.test_export("chat_messages", "admin")
+        tester.test_export("announcements", "admin")
+        tester.test_export_ndjson("chat_messages")
+        tester.test_export_ndjson("announcements")
+        if admin_message:
+            tester.test_export_time_range(admin_message)
+
+    # Test 9: Profiling
+    print("\n⏱️  Testing Profiling...")
+    if admin_success:
+        tester.test_profiling()
+
+    # Test 10: Logout
     print("\n🚪 Testing Logout...")
     tester.test_logout("regular")
     if admin_success:
@@ -0,0 +1,75 @@
+import asyncio
+import importlib.util
+import re
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+
+SERVER_PATH = Path(__file__).resolve().parent.parent / "backend" / "server.py"
+
+
+def load_server():
+    # Creating the Motor client does not connect, so no MongoDB is needed here
+    spec = importlib.util.spec_from_file_location("tfd_server", SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_profiled(server, role, busy_seconds=0.0):
+    """Send one opted-in request through ProfilingMiddleware; return (sampling seen by the app, response headers)."""
+    seen = {}
+    
+    async def app(scope, receive, send):
+        seen["sampling"] = server.ProfilingMiddleware.sampling
+        deadline = time.perf_counter() + busy_seconds
+        while time.perf_counter() < deadline:
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+    
+    token = server.create_access_token(data={"sub": "user-id", "role": role})
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/users/me",
+        "headers": [(b"authorization", f"Bearer {token}".encode()), (b"x-profile", b"1")],
+    }
+    messages = []
+    
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    
+    async def send(message):
+        messages.append(message)
+    
+    asyncio.run(server.ProfilingMiddleware(app)(scope, receive, send))
+    return seen["sampling"], dict(messages[0]["headers"])
+
+
+def test_regular_user_opt_in_does_not_sample(monkeypatch):
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "0")
+    server = load_server()
+    
+    sampling, headers = run_profiled(server, "user")
+    
+    assert sampling is False
+    assert b"x-profile-id" not in headers
+    assert not server.stored_profiles
+
+
+def test_admin_opt_in_stores_collapsed_stacks(monkeypatch):
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "0")
+    monkeypatch.setenv("PROFILE_INTERVAL_MS", "1")
+    server = load_server()
+    
+    sampling, headers = run_profiled(server, "admin", busy_seconds=0.05)
+    
+    assert sampling is True
+    assert server.ProfilingMiddleware.sampling is False
+    profile = server.stored_profiles[headers[b"x-profile-id"].decode()]
+    assert profile and all(re.fullmatch(r"\S+ \d+", line) for line in profile.splitlines())
@@ -0,0 +1,34 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+SERVER_PATH = Path(__file__).resolve().parent.parent / "backend" / "server.py"
+
+
+def load_server():
+    # Creating the Motor client does not connect, so no MongoDB is needed here
+    spec = importlib.util.spec_from_file_location("tfd_server", SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_reads_prefer_secondaries_and_writes_stay_on_primary(monkeypatch):
+    monkeypatch.setenv("MONGO_READ_MAX_STALENESS_SECONDS", "120")
+    server = load_server()
+    
+    assert isinstance(server.read_db.read_preference, SecondaryPreferred)
+    assert server.read_db.read_preference.max_staleness == 120
+    assert isinstance(server.db.read_preference, Primary)
+
+
+def test_rejects_staleness_below_mongodb_minimum(monkeypatch):
+    monkeypatch.setenv("MONGO_READ_MAX_STALENESS_SECONDS", "30")
+    with pytest.raises(ValueError):
+        load_server()